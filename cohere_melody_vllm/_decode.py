@@ -0,0 +1,38 @@
+"""Incremental decoding of token ids into token sized text fragments.
+
+Only relies on the `decode` method of the tokenizer, so it can be used and
+tested without vLLM.
+"""
+
+from typing import Any, Iterator, Sequence
+
+REPLACEMENT_CHAR = "\ufffd"
+# A UTF-8 character is at most 4 bytes, so tokens that still decode to an
+# incomplete string after this many are emitted as is.
+MAX_PENDING_TOKENS = 4
+
+
+def _iter_decoded(
+    tokenizer: Any, token_ids: Sequence[int]
+) -> Iterator[tuple[str, list[int]]]:
+    """Decode ``token_ids`` into token sized string fragments.
+
+    Yields ``(text, ids)`` pairs where ``ids`` are the tokens that produced
+    ``text``. Tokens that generate incomplete strings are buffered and decoded
+    together with the following ones, so each token is decoded a bounded
+    number of times.
+    """
+    decode = tokenizer.decode
+    token_buf: list[int] = []
+    for t in token_ids:
+        token_buf.append(t)
+        token_str = decode(token_buf, skip_special_tokens=False)
+        # buffer tokens that generate incomplete strings
+        if token_str.endswith(REPLACEMENT_CHAR) and len(token_buf) < MAX_PENDING_TOKENS:
+            continue
+
+        yield token_str, token_buf
+        token_buf = []
+
+    if len(token_buf) > 0:
+        yield decode(token_buf, skip_special_tokens=False), token_buf
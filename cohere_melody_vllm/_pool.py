@@ -0,0 +1,51 @@
+"""Pool of reusable melody filters.
+
+Filters are checked out for a single generation and reset before they are
+returned, so the Rust side allocations are reused across requests.
+"""
+
+import queue
+from contextlib import contextmanager
+from typing import Generator
+
+from cohere_melody import PyFilter, PyFilterOptions  # type: ignore
+
+
+class FilterPool:
+    """Thread safe free lists of `PyFilter` instances keyed by configuration."""
+
+    def __init__(self):
+        self._options: dict[str, PyFilterOptions] = {}
+        self._free: dict[str, queue.SimpleQueue[PyFilter]] = {}
+
+    def register(self, key: str, options: PyFilterOptions, warm: int = 0) -> None:
+        """Register the options used for filters of `key`.
+
+        `warm` filters are created up front so the first requests do not pay
+        for their construction.
+        """
+        self._options[key] = options
+        self._free[key] = queue.SimpleQueue()
+        for _ in range(warm):
+            self._free[key].put(PyFilter(options))
+
+    def get(self, key: str) -> PyFilter:
+        """Return a free filter for `key`, creating one if none is available."""
+        try:
+            return self._free[key].get_nowait()
+        except queue.Empty:
+            return PyFilter(self._options[key])
+
+    def put(self, key: str, melody: PyFilter) -> None:
+        """Reset `melody` and return it to the free list of `key`."""
+        melody.reset()
+        self._free[key].put(melody)
+
+    @contextmanager
+    def checkout(self, key: str) -> Generator[PyFilter, None, None]:
+        """Check out a filter for `key` for the duration of the block."""
+        melody = self.get(key)
+        try:
+            yield melody
+        finally:
+            self.put(key, melody)
@@ -3,7 +3,7 @@
 Wraps the melody functionality into vLLM parsers for reasoning and tool calls.
 """
 
-from typing import Optional, Sequence, Union
+from typing import Any, Optional, Sequence, Union
 from vllm.entrypoints.openai.protocol import (
     ChatCompletionRequest,
     ResponsesRequest,
@@ -24,7 +24,59 @@ try:
 except ModuleNotFoundError:
     raise RuntimeError("The compiled melody bindings are not available.")
 
-REPLACEMENT_CHAR = "\ufffd"
+from cohere_melody_vllm._decode import _iter_decoded
+from cohere_melody_vllm._pool import FilterPool
+
+# Filters that ignore special tool action tokens, used when parsing complete
+# outputs since the tool parser will be called on the resulting content.
+NO_ACTION_FILTER = "cmd3_no_action"
+_POOL = FilterPool()
+_POOL.register(
+    NO_ACTION_FILTER,
+    PyFilterOptions()
+    .cmd3()
+    .remove_token("<|START_ACTION|>")
+    .remove_token("<|END_ACTION|>"),
+    warm=2,
+)
+
+
+def _text_fields(columns: Any) -> dict[str, Any]:
+    """Join the texts of ``columns`` into `DeltaMessage` content fields."""
+    content_parts: list[str] = []
+    reasoning_parts: list[str] = []
+    for text, is_reasoning in zip(columns.texts, columns.is_reasoning):
+        if is_reasoning:
+            reasoning_parts.append(text)
+        else:
+            content_parts.append(text)
+
+    fields: dict[str, Any] = {}
+    if content_parts:
+        fields["content"] = "".join(content_parts)
+    if reasoning_parts:
+        # `reasoning_content` is overwritten from `reasoning` after validation
+        fields["reasoning"] = "".join(reasoning_parts)
+    return fields
+
+
+def _delta_tool_calls(columns: Any) -> list[DeltaToolCall]:
+    """Convert the tool call deltas of melody output columns for vLLM."""
+    return [
+        DeltaToolCall(
+            id=id,
+            index=index,
+            type="function",
+            function=DeltaFunctionCall(name=name, arguments=arguments),
+        )
+        for id, index, name, arguments in zip(
+            columns.tool_call_ids,
+            columns.tool_call_indices,
+            columns.tool_call_names,
+            columns.tool_call_raw_param_deltas,
+        )
+        if index is not None
+    ]
 
 
 @ReasoningParserManager.register_module(["cohere2"])
@@ -43,112 +95,38 @@ class CohereCommand2ReasoningParser(ReasoningParser):
         current_token_ids: Sequence[int],
         delta_token_ids: Sequence[int],
     ) -> Union[DeltaMessage, None]:
-
-        out = self.melody.write_decoded(delta_text)
-
-        content = None
-        reasoning_content = None
-        delta_tool_calls: list[DeltaToolCall] = []
-        for o in out:
-            if o.text is not None:
-                if o.is_reasoning:
-                    reasoning_content = (
-                        "" if reasoning_content is None else reasoning_content
-                    )
-                    reasoning_content += o.text
-                else:
-                    content = "" if content is None else content
-                    content += o.text
-            if o.tool_call_delta is not None:
-                delta_tool_call = DeltaToolCall(
-                    id=o.tool_call_delta.id,
-                    index=o.tool_call_delta.index,
-                    type="function",
-                    function=DeltaFunctionCall(
-                        name=o.tool_call_delta.name,
-                        arguments=o.tool_call_delta.raw_param_delta,
-                    ),
-                )
-                delta_tool_calls.append(delta_tool_call)
-
-        if content is None and reasoning_content is None and len(delta_tool_calls) == 0:
+        # nothing new was decoded, e.g. the token is an incomplete character
+        if not delta_text:
             return None
 
-        msg = DeltaMessage()
-        if content is not None:
-            msg.content = content
-        if reasoning_content is not None:
-            msg.reasoning_content = reasoning_content
-        if len(delta_tool_calls) > 0:
-            msg.tool_calls = delta_tool_calls
+        out = self.melody.write_decoded_columns(delta_text)
+
+        # build the message in one call so it is validated only once
+        fields = _text_fields(out)
+        delta_tool_calls = _delta_tool_calls(out)
+        if delta_tool_calls:
+            fields["tool_calls"] = delta_tool_calls
 
-        return msg
+        return DeltaMessage(**fields) if fields else None
 
     def extract_reasoning(
         self, model_output: str, request: ChatCompletionRequest | ResponsesRequest
     ) -> tuple[Optional[str], Optional[str]]:
-        reasoning_content = None
-        content = None
-        # create a new melody parser that ignores special tool action tokens
-        # since the tool parser will be called on the resulting content
-        melody = PyFilter(
-            PyFilterOptions()
-            .cmd3()
-            .remove_token("<|START_ACTION|>")
-            .remove_token("<|END_ACTION|>")
-        )
-        # tokenize to provide token size string fragments to melody
-        tokens = self.model_tokenizer.encode(model_output, add_special_tokens=False)
-        token_buf = []
-        for t in tokens:
-            token_buf.append(t)
-            token_str = self.model_tokenizer.decode(
-                token_buf, skip_special_tokens=False
-            )
-            # buffer tokens that generate incomplete strings
-            if token_str.endswith(REPLACEMENT_CHAR):
-                continue
-
-            out = melody.write_decoded(token_str)
-            for o in out:
-                if o.text is not None:
-                    if o.is_reasoning:
-                        reasoning_content = (
-                            "" if reasoning_content is None else reasoning_content
-                        )
-                        reasoning_content += o.text
-                    else:
-                        content = "" if content is None else content
-                        content += o.text
-
-            token_buf = []
-        return reasoning_content, content
+        # melody handles every special token of the text in one write, so the
+        # output does not need to be split into tokens
+        with _POOL.checkout(NO_ACTION_FILTER) as melody:
+            result = melody.extract_all([model_output])
+        return result.reasoning, result.content
 
     def extract_content_ids(self, input_ids: list[int]) -> list[int]:
-        melody = PyFilter(
-            PyFilterOptions()
-            .cmd3()
-            .remove_token("<|START_ACTION|>")
-            .remove_token("<|END_ACTION|>")
-        )
-        token_buf = []
         content_ids = []
-        for t in input_ids:
-            token_buf.append(t)
-            token_str = self.model_tokenizer.decode(
-                token_buf, skip_special_tokens=False
-            )
-            # buffer tokens that generate incomplete strings
-            if token_str.endswith(REPLACEMENT_CHAR):
-                continue
-
-            out = melody.write_decoded(token_str)
-            for o in out:
-                if o.text is not None:
-                    if not o.is_reasoning:
-                        content_ids.extend(token_buf)
-
-            token_buf = []
+        with _POOL.checkout(NO_ACTION_FILTER) as melody:
+            for token_str, token_buf in _iter_decoded(self.model_tokenizer, input_ids):
+                out = melody.write_decoded(token_str)
+                for o in out:
+                    if o.text is not None:
+                        if not o.is_reasoning:
+                            content_ids.extend(token_buf)
         return content_ids
 
     def is_reasoning_end(self, input_ids: list[int]) -> bool:
@@ -178,23 +156,13 @@ class CohereCommand2ToolParser(ToolParser):
         delta_token_ids: Sequence[int],
         request: ChatCompletionRequest,
     ) -> Union[DeltaMessage, None]:
+        # nothing new was decoded, e.g. the token is an incomplete character
+        if not delta_text:
+            return None
 
-        out = self.melody.write_decoded(delta_text)
-
-        delta_tool_calls = []
-        for o in out:
-            if o.tool_call_delta is not None:
-                delta_tool_call = DeltaToolCall(
-                    id=o.tool_call_delta.id,
-                    index=o.tool_call_delta.index,
-                    type="function",
-                    function=DeltaFunctionCall(
-                        name=o.tool_call_delta.name,
-                        arguments=o.tool_call_delta.raw_param_delta,
-                    ),
-                )
-                delta_tool_calls.append(delta_tool_call)
+        out = self.melody.write_decoded_columns(delta_text)
 
+        delta_tool_calls = _delta_tool_calls(out)
         if len(delta_tool_calls) > 0:
             return DeltaMessage(tool_calls=delta_tool_calls)
 
@@ -203,45 +171,22 @@ class CohereCommand2ToolParser(ToolParser):
         model_output: str,
         request: ChatCompletionRequest,
     ) -> ExtractedToolCallInformation:
-        tool_calls: list[ToolCall] = []
-        content: str | None = None
-        token_buf = []
-        # tokenize to provide token size string fragments to melody
-        for t in self.model_tokenizer.encode(model_output, add_special_tokens=False):
-            token_buf.append(t)
-            token_str = self.model_tokenizer.decode(
-                token_buf, skip_special_tokens=False
+        # melody handles every special token of the text in one write, so the
+        # output does not need to be split into tokens
+        result = self.melody.extract_all([model_output])
+        tool_calls = [
+            ToolCall(
+                id=tool_call.id,
+                type="function",
+                function=FunctionCall(
+                    name=tool_call.name, arguments=tool_call.arguments
+                ),
             )
-            # buffer tokens that generate incomplete strings
-            if token_str.endswith(REPLACEMENT_CHAR):
-                continue
-
-            out = self.melody.write_decoded(token_str)
-            for o in out:
-                if o.text is not None:
-                    content = "" if content is None else content
-                    content += o.text
-                if o.tool_call_delta is not None:
-                    if o.tool_call_delta.id != "":
-                        tool_calls.append(
-                            ToolCall(
-                                id=o.tool_call_delta.id,
-                                type="function",
-                                function=FunctionCall(name="", arguments=""),
-                            )
-                        )
-                    if o.tool_call_delta.name != "":
-                        tool_calls[o.tool_call_delta.index].function.name = (
-                            o.tool_call_delta.name
-                        )
-                    tool_calls[
-                        o.tool_call_delta.index
-                    ].function.arguments += o.tool_call_delta.raw_param_delta
-
-            token_buf = []
+            for tool_call in result.tool_calls
+        ]
 
         return ExtractedToolCallInformation(
             tools_called=len(tool_calls) > 0,
             tool_calls=tool_calls,
-            content=content,
+            content=result.content,
         )
@@ -8,7 +8,23 @@ use crate::parsing::options::FilterOptions;
 use crate::parsing::types::{
     FilterMode, FilterOutput, FilterSearchQueryDelta, TokenIDsWithLogProb,
 };
+use aho_corasick::{AhoCorasick, MatchKind};
 use std::collections::HashMap;
+use std::sync::{Arc, LazyLock};
+
+/// Special tokens of a preset together with their matcher.
+type PresetMatcher = (HashMap<String, FilterMode>, Arc<AhoCorasick>);
+
+/// Special token matchers of the preset options, shared by all filters using them.
+static PRESET_MATCHERS: LazyLock<Vec<PresetMatcher>> = LazyLock::new(|| {
+    [FilterOptions::new().cmd3(), FilterOptions::new().cmd4()]
+        .into_iter()
+        .map(|options| {
+            let matcher = build_special_token_matcher(&options.special_token_map);
+            (options.special_token_map, matcher)
+        })
+        .collect()
+});
 
 /// Core trait for streaming token parsers.
 ///
@@ -90,10 +106,13 @@ pub struct FilterImpl {
     // Trimming configuration
     pub(crate) left_trimmed: bool,
     pub(crate) right_trimmed: bool,
+    pub(crate) initial_left_trimmed: bool,
+    pub(crate) initial_right_trimmed: bool,
 
     // Mode and special token configuration
     pub(crate) default_mode: FilterMode,
     pub(crate) special_token_map: HashMap<String, FilterMode>,
+    pub(crate) special_token_matcher: Option<Arc<AhoCorasick>>,
     pub(crate) stream_non_grounded_answer: bool,
     pub(crate) stream_tool_actions: bool,
     pub(crate) stream_processed_params: bool,
@@ -133,8 +152,11 @@ impl FilterImpl {
         Self {
             left_trimmed: false,
             right_trimmed: false,
+            initial_left_trimmed: false,
+            initial_right_trimmed: false,
             default_mode: FilterMode::PlainText,
             special_token_map: HashMap::new(),
+            special_token_matcher: None,
             stream_non_grounded_answer: false,
             stream_tool_actions: false,
             stream_processed_params: false,
@@ -161,7 +183,10 @@ impl FilterImpl {
     pub(crate) fn apply_options(mut self, options: FilterOptions) -> Self {
         self.left_trimmed = options.left_trimmed;
         self.right_trimmed = options.right_trimmed;
+        self.initial_left_trimmed = options.left_trimmed;
+        self.initial_right_trimmed = options.right_trimmed;
         self.chunk_size = options.chunk_size;
+        self.buf.reserve(options.initial_capacity);
         self.stream_non_grounded_answer = options.stream_non_grounded_answer;
         self.stream_tool_actions = options.stream_tool_actions;
         self.stream_processed_params = options.stream_processed_params;
@@ -187,9 +212,38 @@ impl FilterImpl {
                 .insert(stop, FilterMode::ExclusiveStop);
         }
 
+        self.special_token_matcher = Some(special_token_matcher(&self.special_token_map));
         self
     }
 
+    /// Reset the parsing state so the filter can be reused for another generation.
+    ///
+    /// The configuration, the special token matcher and the buffer allocation
+    /// are kept, so a reset is much cheaper than creating a new filter.
+    pub fn reset(&mut self) {
+        let mut buf = std::mem::take(&mut self.buf);
+        buf.clear();
+        let filter = std::mem::replace(self, Self::new());
+        *self = Self {
+            left_trimmed: filter.initial_left_trimmed,
+            right_trimmed: filter.initial_right_trimmed,
+            initial_left_trimmed: filter.initial_left_trimmed,
+            initial_right_trimmed: filter.initial_right_trimmed,
+            default_mode: filter.default_mode,
+            special_token_map: filter.special_token_map,
+            special_token_matcher: filter.special_token_matcher,
+            stream_non_grounded_answer: filter.stream_non_grounded_answer,
+            stream_tool_actions: filter.stream_tool_actions,
+            stream_processed_params: filter.stream_processed_params,
+            has_tool_call_id: filter.has_tool_call_id,
+            cmd3_citations: filter.cmd3_citations,
+            chunk_size: filter.chunk_size,
+            buf,
+            mode: filter.default_mode,
+            ..Self::new()
+        };
+    }
+
     pub(crate) fn write_text(
         &mut self,
         text: &[u8],
@@ -200,53 +254,68 @@ impl FilterImpl {
         }
 
         self.buf.extend_from_slice(text);
-        let str = String::from_utf8_lossy(&self.buf).to_string();
-
-        // If is a partial special token, we need to wait for the next token.
-        let (special_token_idx, found_seq) = find_partial(&str, &mut self.special_token_map.keys());
-        if special_token_idx != usize::MAX && found_seq.is_empty() {
-            self.partial_special_token_log_prob = logprobs;
-            return Vec::new();
-        }
 
         let mut out = Vec::new();
+        let mut handled_special = false;
+
+        // Handle every special token in the buffer, so text containing several
+        // of them is filtered the same as when it is written token by token.
+        loop {
+            let str = String::from_utf8_lossy(&self.buf).to_string();
 
-        // If it is a whole special token, change the mode, remove the tokens and continue
-        if special_token_idx != usize::MAX && !found_seq.is_empty() {
+            // If is a partial special token, we need to wait for the next token.
+            let (special_token_idx, found_seq) = self.find_special_token(&str);
+            if special_token_idx == usize::MAX {
+                break;
+            }
+            if found_seq.is_empty() {
+                // Text following a special token of this write comes before the
+                // partial token, so process it as if it was written on its own.
+                if handled_special {
+                    out.extend(self.process_before_partial(special_token_idx, &logprobs));
+                }
+                self.partial_special_token_log_prob = logprobs;
+                return out;
+            }
+
+            // If it is a whole special token, change the mode, remove the tokens and continue
             let (o, new_mode, stop, valid_special) =
                 self.handle_special_token(&str, special_token_idx, &found_seq, self.mode);
             out.extend(o);
 
-            if valid_special {
-                if stop {
-                    self.buf.clear();
-                    self.done = true;
-                    return out;
-                }
-
-                // Before the special token, process the buffer with the old mode
-                let pre_special_token = &str[..special_token_idx];
-                if !pre_special_token.is_empty() {
-                    // Take ownership temporarily to avoid clone
-                    let partial_log_prob = std::mem::take(&mut self.partial_special_token_log_prob);
-                    let (o, _) = self.handle_token(
-                        self.mode,
-                        pre_special_token.as_bytes(),
-                        false,
-                        &partial_log_prob,
-                    );
-                    // restore
-                    self.partial_special_token_log_prob = partial_log_prob;
-                    out.extend(o);
-                }
+            if !valid_special {
+                break;
+            }
 
-                // Remove the special token and the text before
-                let remove_len = pre_special_token.len() + found_seq.len();
-                self.buf.drain(..remove_len);
+            if stop {
+                self.buf.clear();
+                self.done = true;
+                return out;
+            }
 
-                // Change mode
-                self.mode = new_mode;
+            // Before the special token, process the buffer with the old mode
+            let pre_special_token = &str[..special_token_idx];
+            if !pre_special_token.is_empty() {
+                // Take ownership temporarily to avoid clone
+                let partial_log_prob = std::mem::take(&mut self.partial_special_token_log_prob);
+                let (o, _) = self.handle_token(
+                    self.mode,
+                    pre_special_token.as_bytes(),
+                    false,
+                    &partial_log_prob,
+                );
+                // restore
+                self.partial_special_token_log_prob = partial_log_prob;
+                out.extend(o);
             }
+
+            // Remove the special token and the text before
+            let remove_len = pre_special_token.len() + found_seq.len();
+            self.buf.drain(..remove_len);
+
+            // Change mode
+            self.mode = new_mode;
+            handled_special = true;
         }
 
         // Process buffer by mode
@@ -273,6 +342,59 @@ impl FilterImpl {
         out
     }
 
+    /// Process the text buffered before a trailing partial special token.
+    ///
+    /// A write ending in the start of a special token holds its whole text
+    /// until the token is complete. Once all text of a generation is written,
+    /// this processes the text before the partial token as if it had been
+    /// written on its own, which is what writing token by token does. The
+    /// partial token itself stays buffered.
+    #[must_use]
+    pub fn write_pending_text(&mut self) -> Vec<FilterOutput> {
+        if self.done || self.buf.is_empty() {
+            return Vec::new();
+        }
+
+        let str = String::from_utf8_lossy(&self.buf).to_string();
+        let partial_idx = find_partial_suffix(&str, self.special_token_map.keys());
+        if partial_idx == usize::MAX {
+            return Vec::new();
+        }
+
+        let partial_log_prob = std::mem::take(&mut self.partial_special_token_log_prob);
+        let out = self.process_before_partial(partial_idx, &partial_log_prob);
+        self.partial_special_token_log_prob = partial_log_prob;
+        out
+    }
+
+    /// Process the buffer up to the partial special token at `idx` in the current mode.
+    fn process_before_partial(
+        &mut self,
+        idx: usize,
+        logprobs: &TokenIDsWithLogProb,
+    ) -> Vec<FilterOutput> {
+        if idx == 0 {
+            return Vec::new();
+        }
+        let pre_partial_token = self.buf[..idx].to_vec();
+        let (out, remove) = self.handle_token(self.mode, &pre_partial_token, false, logprobs);
+        self.buf.drain(..remove);
+        out
+    }
+
+    /// Like `find_partial` over the special tokens, but finds whole tokens with
+    /// a single scan of the prebuilt matcher. Returns the leftmost token if
+    /// several are present.
+    fn find_special_token(&self, s: &str) -> (usize, String) {
+        if let Some(m) = self.special_token_matcher.as_ref().and_then(|m| m.find(s)) {
+            return (m.start(), s[m.range()].to_string());
+        }
+        (
+            find_partial_suffix(s, self.special_token_map.keys()),
+            String::new(),
+        )
+    }
+
     fn handle_token(
         &mut self,
         mode: FilterMode,
@@ -505,18 +627,55 @@ impl Filter for FilterImpl {
     }
 }
 
+/// Return the matcher used to find whole special tokens in the buffer.
+///
+/// The matchers of the presets are built once and shared; other sets of
+/// special tokens, e.g. with stop sequences, get a matcher of their own.
+fn special_token_matcher(special_token_map: &HashMap<String, FilterMode>) -> Arc<AhoCorasick> {
+    let preset = PRESET_MATCHERS.iter().find(|(tokens, _)| {
+        tokens.len() == special_token_map.len()
+            && special_token_map
+                .keys()
+                .all(|token| tokens.contains_key(token))
+    });
+    match preset {
+        Some((_, matcher)) => Arc::clone(matcher),
+        None => build_special_token_matcher(special_token_map),
+    }
+}
+
+fn build_special_token_matcher(
+    special_token_map: &HashMap<String, FilterMode>,
+) -> Arc<AhoCorasick> {
+    Arc::new(
+        AhoCorasick::builder()
+            .match_kind(MatchKind::LeftmostLongest)
+            .build(special_token_map.keys())
+            .expect("Invalid special token matcher"),
+    )
+}
+
 /// Find partial returns first index in str that might match one of stop sequences.
 pub(crate) fn find_partial<'a>(
     s: &str,
-    stops: impl Iterator<Item = &'a String>,
+    stops: impl Iterator<Item = &'a String> + Clone,
 ) -> (usize, String) {
-    let mut min_idx = usize::MAX;
-
-    for stop in stops {
+    for stop in stops.clone() {
         // If we find the stop sequence, return the index and the stop sequence
         if let Some(idx) = s.find(stop) {
             return (idx, stop.clone());
         }
+    }
+
+    (find_partial_suffix(s, stops), String::new())
+}
+
+/// Returns the first index of a suffix of `s` that is a prefix of one of the stop
+/// sequences, or `usize::MAX` if there is none.
+pub(crate) fn find_partial_suffix<'a>(s: &str, stops: impl Iterator<Item = &'a String>) -> usize {
+    let mut min_idx = usize::MAX;
+
+    for stop in stops {
         // Go through the substrings of the stop sequence
         'inner: for i in 0..stop.len() {
             if !stop.is_char_boundary(stop.len() - i) {
@@ -526,7 +685,7 @@ pub(crate) fn find_partial<'a>(
 
             if s.ends_with(suffix) {
                 let idx = s.len() - suffix.len();
-                if min_idx == usize::MAX || min_idx > idx {
+                if min_idx > idx {
                     min_idx = idx;
                 }
                 break;
@@ -534,19 +693,58 @@ pub(crate) fn find_partial<'a>(
         }
     }
 
-    (
-        if min_idx == usize::MAX {
-            usize::MAX
-        } else {
-            min_idx
-        },
-        String::new(),
-    )
+    min_idx
+}
+
+/// Merges adjacent text outputs of the same kind into a single output.
+///
+/// Outputs are merged when they agree on `is_reasoning` and `is_post_answer`
+/// and carry neither a tool call delta nor a search query. Their text,
+/// logprobs and citations are concatenated; citation indices are relative to
+/// the whole generation, so they stay valid.
+///
+/// # Examples
+///
+/// ```rust
+/// use cohere_melody::parsing::coalesce_outputs;
+/// use cohere_melody::parsing::types::FilterOutput;
+///
+/// let text = |s: &str, is_reasoning| FilterOutput {
+///     text: s.to_string(),
+///     is_reasoning,
+///     ..Default::default()
+/// };
+/// let out = coalesce_outputs(vec![text("a", true), text("b", true), text("c", false)]);
+/// assert_eq!(out, vec![text("ab", true), text("c", false)]);
+/// ```
+#[must_use]
+pub fn coalesce_outputs(outputs: Vec<FilterOutput>) -> Vec<FilterOutput> {
+    let is_text = |o: &FilterOutput| o.tool_call_delta.is_none() && o.search_query.is_none();
+
+    let mut out: Vec<FilterOutput> = Vec::with_capacity(outputs.len());
+    for output in outputs {
+        if let Some(prev) = out.last_mut()
+            && is_text(prev)
+            && is_text(&output)
+            && prev.is_reasoning == output.is_reasoning
+            && prev.is_post_answer == output.is_post_answer
+        {
+            prev.text.push_str(&output.text);
+            prev.logprobs.append(output.logprobs);
+            prev.citations.extend(output.citations);
+            continue;
+        }
+        out.push(output);
+    }
+    out
 }
 
 #[cfg(test)]
 mod tests {
     use crate::parsing::filter::find_partial;
+    use crate::parsing::types::{FilterOutput, FilterResult, FilterToolCallDelta};
+    use crate::parsing::{Filter, FilterOptions, coalesce_outputs, new_filter};
+    use std::sync::Arc;
 
     #[test]
     fn test_find_partial() {
@@ -575,4 +773,201 @@ mod tests {
         assert_eq!(idx, 14);
         assert_eq!(found, "");
     }
+
+    #[test]
+    fn test_find_special_token() {
+        let filter = new_filter(FilterOptions::new().cmd3());
+
+        // Test leftmost full match
+        let (idx, found) = filter.find_special_token("a<|END_THINKING|>b<|START_RESPONSE|>");
+        assert_eq!(idx, 1);
+        assert_eq!(found, "<|END_THINKING|>");
+
+        // Test partial match
+        let (idx, found) = filter.find_special_token("hello <|START_");
+        assert_eq!(idx, 6);
+        assert_eq!(found, "");
+
+        // Test no match
+        let (idx, _) = filter.find_special_token("hello world");
+        assert_eq!(idx, usize::MAX);
+    }
+
+    #[test]
+    fn test_special_token_matcher_presets() {
+        let matcher = |options: FilterOptions| new_filter(options).special_token_matcher.unwrap();
+        let cmd3 = matcher(FilterOptions::new().cmd3());
+        assert!(Arc::ptr_eq(&cmd3, &matcher(FilterOptions::new().cmd3())));
+        assert!(!Arc::ptr_eq(&cmd3, &matcher(FilterOptions::new().cmd4())));
+
+        // Options that change the special tokens get a matcher of their own
+        let stops = || {
+            FilterOptions::new()
+                .cmd3()
+                .with_exclusive_stops(vec!["STOP".to_string()])
+        };
+        let with_stops = matcher(stops());
+        assert!(!Arc::ptr_eq(&with_stops, &cmd3));
+        assert!(!Arc::ptr_eq(&with_stops, &matcher(stops())));
+    }
+
+    #[test]
+    fn test_initial_capacity() {
+        let filter = new_filter(FilterOptions::new());
+        assert!(filter.buf.capacity() >= 4096);
+
+        let options = FilterOptions::new().with_initial_capacity(10_000);
+        assert_eq!(options.initial_capacity, 10_000);
+        let filter = new_filter(options);
+        assert!(filter.buf.capacity() >= 10_000);
+    }
+
+    #[test]
+    fn test_reset() {
+        let options = FilterOptions::new().cmd3();
+        let mut filter = new_filter(options.clone());
+        let out = filter.write_decoded("<|START_THINKING|>plan", Default::default());
+        assert_eq!(out[0].text, "plan");
+        filter.write_decoded("<|END_THINK", Default::default());
+        assert!(!filter.buf.is_empty());
+
+        let capacity = filter.buf.capacity();
+        let matcher = filter.special_token_matcher.clone().unwrap();
+        filter.reset();
+        assert!(filter.buf.is_empty());
+        assert_eq!(filter.buf.capacity(), capacity);
+        assert!(Arc::ptr_eq(
+            &filter.special_token_matcher.clone().unwrap(),
+            &matcher
+        ));
+        let out = filter.write_decoded("hello", Default::default());
+        assert_eq!(out[0].text, "hello");
+        assert!(!out[0].is_reasoning);
+
+        // After a generation with mode changes, a reset filter behaves like a new one
+        filter.write_decoded("<|START_THINKING|>plan<|END_THINKING|>", Default::default());
+        filter.reset();
+        let mut fresh = new_filter(options);
+        for token in [
+            "<|START_THINKING|>",
+            "plan",
+            "<|END_THINKING|>",
+            "<|START_RESPONSE|>",
+            " done",
+        ] {
+            assert_eq!(
+                filter.write_decoded(token, Default::default()),
+                fresh.write_decoded(token, Default::default())
+            );
+        }
+    }
+
+    #[test]
+    fn test_coalesce_outputs() {
+        let text = |s: &str, is_reasoning| FilterOutput {
+            text: s.to_string(),
+            is_reasoning,
+            ..Default::default()
+        };
+        let tool = FilterOutput {
+            tool_call_delta: Some(FilterToolCallDelta {
+                name: "search".to_string(),
+                ..Default::default()
+            }),
+            ..Default::default()
+        };
+
+        let out = coalesce_outputs(vec![
+            text("I", true),
+            text(" will", true),
+            tool.clone(),
+            text("Found", false),
+            text(" it.", false),
+        ]);
+        assert_eq!(
+            out,
+            vec![text("I will", true), tool, text("Found it.", false)]
+        );
+    }
+
+    #[test]
+    fn test_filter_result() {
+        let mut filter = new_filter(FilterOptions::new().cmd3());
+        let mut result = FilterResult::default();
+        for token in [
+            "<|START_THINKING|>",
+            "I will",
+            " search.",
+            "<|END_THINKING|>",
+            "<|START_ACTION|>",
+            "[\n    {\"tool_call_id\": \"0\", \"tool_name\": \"sea",
+            "rch\", \"parameters\": {\"query\": \"melo",
+            "dy\"}}\n]",
+            "<|END_ACTION|>",
+        ] {
+            for output in filter.write_decoded(token, Default::default()) {
+                result.push(output);
+            }
+        }
+
+        assert_eq!(result.reasoning.as_deref(), Some("I will search."));
+        assert_eq!(result.tool_calls.len(), 1);
+        assert_eq!(result.tool_calls[0].id, "0");
+        assert_eq!(result.tool_calls[0].name, "search");
+        assert_eq!(result.tool_calls[0].arguments, "{\"query\": \"melody\"}");
+    }
+
+    #[test]
+    fn test_write_decoded_whole_text() {
+        let tokens = [
+            "<|START_THINKING|>",
+            "I will",
+            " search.",
+            "<|END_THINKING|>",
+            "<|START_ACTION|>",
+            "[\n    {\"tool_call_id\": \"0\", \"tool_name\": \"sea",
+            "rch\", \"parameters\": {\"query\": \"melo",
+            "dy\"}}\n]",
+            "<|END_ACTION|>",
+            "<|START_RESPONSE|>",
+            "Found",
+            " it.",
+            "<|END_RESPONSE|>",
+        ];
+        let extract = |chunks: &[&str], write_pending: bool| {
+            let mut filter = new_filter(FilterOptions::new().cmd3());
+            let mut result = FilterResult::default();
+            for chunk in chunks {
+                for output in filter.write_decoded(chunk, Default::default()) {
+                    result.push(output);
+                }
+            }
+            if write_pending {
+                for output in filter.write_pending_text() {
+                    result.push(output);
+                }
+            }
+            result
+        };
+
+        let per_token = extract(&tokens, false);
+        assert_eq!(per_token.content.as_deref(), Some("Found it."));
+        assert_eq!(extract(&[&tokens.concat()], false), per_token);
+
+        // Text before a trailing partial special token is not held back
+        let truncated = ["<|START_RESPONSE|>", "Found", " it.", "<|END"];
+        let per_token = extract(&truncated, false);
+        assert_eq!(per_token.content.as_deref(), Some("Found it."));
+        assert_eq!(extract(&[&truncated.concat()], false), per_token);
+
+        // Without a special token before it, the text is processed once the
+        // whole generation is written
+        for trailing in [" <", " <|", " <|END"] {
+            let tokens = ["Use", " the", trailing];
+            let per_token = extract(&tokens, false);
+            assert_eq!(per_token.content.as_deref(), Some("Use the"));
+            assert_eq!(extract(&tokens, true), per_token);
+            assert_eq!(extract(&[&tokens.concat()], true), per_token);
+        }
+    }
 }
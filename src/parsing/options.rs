@@ -6,6 +6,9 @@ use crate::parsing::filter::FilterImpl;
 use crate::parsing::types::FilterMode;
 use std::collections::HashMap;
 
+/// Default number of bytes reserved for the filter buffer.
+const DEFAULT_INITIAL_CAPACITY: usize = 4096;
+
 /// Configuration builder for creating filters.
 ///
 /// This struct uses the builder pattern to configure filter behavior before creating
@@ -32,6 +35,7 @@ pub struct FilterOptions {
     pub(crate) inclusive_stops: Vec<String>,
     pub(crate) exclusive_stops: Vec<String>,
     pub(crate) chunk_size: usize,
+    pub(crate) initial_capacity: usize,
     pub(crate) special_token_map: HashMap<String, FilterMode>,
     pub(crate) default_mode: FilterMode,
     pub(crate) stream_non_grounded_answer: bool,
@@ -49,6 +53,7 @@ impl Default for FilterOptions {
             inclusive_stops: Vec::new(),
             exclusive_stops: Vec::new(),
             chunk_size: 1,
+            initial_capacity: DEFAULT_INITIAL_CAPACITY,
             special_token_map: HashMap::new(),
             default_mode: FilterMode::PlainText,
             stream_non_grounded_answer: false,
@@ -67,6 +72,7 @@ impl FilterOptions {
     /// - No trimming
     /// - No stop sequences
     /// - Chunk size of 1
+    /// - 4 KiB reserved for buffered content
     /// - Plain text mode
     /// - No streaming of tool actions or parameters
     ///
@@ -274,6 +280,29 @@ impl FilterOptions {
         self
     }
 
+    /// Set the number of bytes reserved up front for buffered content.
+    ///
+    /// Reserving enough space for the content that is buffered while waiting
+    /// for special tokens or complete structures avoids regrowing the buffer
+    /// during generation.
+    ///
+    /// # Arguments
+    ///
+    /// * `capacity` - Number of bytes to reserve
+    ///
+    /// # Examples
+    ///
+    /// ```rust
+    /// use cohere_melody::parsing::FilterOptions;
+    ///
+    /// let options = FilterOptions::new().with_initial_capacity(16 * 1024);
+    /// ```
+    #[must_use]
+    pub fn with_initial_capacity(mut self, capacity: usize) -> Self {
+        self.initial_capacity = capacity;
+        self
+    }
+
     /// Configure for RAG (Retrieval Augmented Generation) format.
     ///
     /// This preset is for older RAG-style outputs that use text markers like
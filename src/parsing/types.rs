@@ -165,6 +165,90 @@ pub struct FilterToolCallDelta {
     pub raw_param_delta: String,
 }
 
+/// A complete tool call assembled from `FilterToolCallDelta` updates.
+///
+/// # Examples
+///
+/// ```rust
+/// use cohere_melody::parsing::types::FilterToolCall;
+///
+/// let call = FilterToolCall {
+///     id: "call_0".to_string(),
+///     name: "search".to_string(),
+///     arguments: "{\"query\": \"hello\"}".to_string(),
+/// };
+/// assert_eq!(call.name, "search");
+/// ```
+#[cfg_attr(feature = "python_ffi", pyclass(get_all))]
+#[derive(Debug, Clone, PartialEq, Default)]
+pub struct FilterToolCall {
+    /// Tool call identifier (CMD3+ only)
+    pub id: String,
+    /// Name of the tool being called
+    pub name: String,
+    /// Raw JSON parameter text
+    pub arguments: String,
+}
+
+/// The aggregated outputs of a complete generation.
+///
+/// Built by pushing every `FilterOutput` of a generation in order. Text is
+/// split into reasoning and content, and tool call deltas are merged into
+/// complete tool calls.
+///
+/// # Examples
+///
+/// ```rust
+/// use cohere_melody::parsing::types::{FilterOutput, FilterResult};
+///
+/// let mut result = FilterResult::default();
+/// result.push(FilterOutput {
+///     text: "Hello".to_string(),
+///     ..Default::default()
+/// });
+/// assert_eq!(result.content, Some("Hello".to_string()));
+/// assert_eq!(result.reasoning, None);
+/// ```
+#[cfg_attr(feature = "python_ffi", pyclass(get_all))]
+#[derive(Debug, Clone, PartialEq, Default)]
+pub struct FilterResult {
+    /// Text outside of reasoning blocks (None if no such output was seen)
+    pub content: Option<String>,
+    /// Text from reasoning blocks (None if no such output was seen)
+    pub reasoning: Option<String>,
+    /// Tool calls in the order they were started
+    pub tool_calls: Vec<FilterToolCall>,
+}
+
+impl FilterResult {
+    /// Adds a filter output to the result.
+    pub fn push(&mut self, output: FilterOutput) {
+        let text = if output.is_reasoning {
+            &mut self.reasoning
+        } else {
+            &mut self.content
+        };
+        text.get_or_insert_with(String::new).push_str(&output.text);
+
+        if let Some(delta) = output.tool_call_delta {
+            if !delta.id.is_empty() {
+                self.tool_calls.push(FilterToolCall {
+                    id: delta.id,
+                    ..Default::default()
+                });
+            }
+            let Some(call) = self.tool_calls.get_mut(delta.index) else {
+                log::warn!("tool call delta for unknown tool call {}", delta.index);
+                return;
+            };
+            if !delta.name.is_empty() {
+                call.name = delta.name;
+            }
+            call.arguments.push_str(&delta.raw_param_delta);
+        }
+    }
+}
+
 /// A parsed tool parameter update.
 ///
 /// When `stream_processed_params` is enabled, parameters are parsed into
@@ -3,18 +3,78 @@
 //! This module provides Python bindings using `PyO3`, allowing the Melody parser
 //! to be used directly from Python code.
 
-use crate::parsing::types::{FilterOutput, TokenIDsWithLogProb};
-use crate::parsing::{Filter, FilterImpl, FilterOptions, new_filter};
+use crate::parsing::types::{FilterOutput, FilterResult, TokenIDsWithLogProb};
+use crate::parsing::{Filter, FilterImpl, FilterOptions, coalesce_outputs, new_filter};
+use pyo3::IntoPyObjectExt;
 use pyo3::prelude::*;
+use pyo3::types::PyList;
+use std::collections::HashMap;
+use std::time::{Duration, Instant};
 
 /// Python wrapper for the streaming filter.
 ///
 /// This class provides the main interface for parsing model outputs from Python.
 /// Create an instance with `PyFilterOptions` and then call `write_decoded` for
 /// each token as it arrives.
+///
+/// The GIL is released while tokens are filtered, so filters used by different
+/// threads run concurrently. A single filter must not be shared between
+/// threads: concurrent calls on the same instance raise a `RuntimeError`.
 #[pyclass]
 struct PyFilter {
     inner: FilterImpl,
+    stats: Option<FilterStats>,
+}
+
+/// Counters accumulated by a filter created with `with_stats()`.
+#[derive(Default)]
+struct FilterStats {
+    bytes_in: u64,
+    filter_ns: u64,
+    convert_ns: u64,
+    events_emitted: u64,
+}
+
+impl FilterStats {
+    fn record(&mut self, bytes_in: usize, events: usize, filter: Duration, convert: Duration) {
+        self.bytes_in += bytes_in as u64;
+        self.events_emitted += events as u64;
+        self.filter_ns += u64::try_from(filter.as_nanos()).unwrap_or(u64::MAX);
+        self.convert_ns += u64::try_from(convert.as_nanos()).unwrap_or(u64::MAX);
+    }
+}
+
+impl PyFilter {
+    /// Run `write` with the GIL released and convert its result to Python.
+    ///
+    /// `write` returns its result and the number of outputs the filter
+    /// produced, which are recorded with the timings when stats are enabled.
+    fn run<'py, T, F>(
+        &mut self,
+        py: Python<'py>,
+        bytes_in: usize,
+        write: F,
+    ) -> PyResult<Bound<'py, PyAny>>
+    where
+        T: IntoPyObject<'py> + Send,
+        F: FnOnce(&mut FilterImpl) -> (T, usize) + Send,
+    {
+        let inner = &mut self.inner;
+        let Some(stats) = self.stats.as_mut() else {
+            let (result, _) = py.detach(|| write(inner));
+            return result.into_bound_py_any(py);
+        };
+
+        let (result, events, filter) = py.detach(|| {
+            let start = Instant::now();
+            let (result, events) = write(inner);
+            (result, events, start.elapsed())
+        });
+        let start = Instant::now();
+        let result = result.into_bound_py_any(py)?;
+        stats.record(bytes_in, events, filter, start.elapsed());
+        Ok(result)
+    }
 }
 
 #[pymethods]
@@ -31,22 +91,127 @@ impl PyFilter {
     fn new(opts: &PyFilterOptions) -> Self {
         PyFilter {
             inner: new_filter(opts.inner.clone()),
+            stats: opts.stats.then(FilterStats::default),
         }
     }
 
+    /// Reset the filter to its initial state so it can be reused.
+    ///
+    /// The filter keeps the options it was created with, its special token
+    /// matcher and its allocated buffers, so only the parsing state is cleared.
+    fn reset(&mut self) {
+        self.inner.reset();
+    }
+
     /// Process a decoded token and return any completed outputs.
     ///
     /// Args:
     ///     `decoded_token`: The decoded text for this token
     ///
     /// Returns:
-    ///     List of `FilterOutput` objects (may be empty if content is buffered)
+    ///     List of `FilterOutput` objects (may be empty if content is buffered).
+    ///     Adjacent text outputs of the same kind are merged into one.
     ///
     /// Note:
     ///     Log probabilities are not currently supported in the Python API
-    fn write_decoded(&mut self, decoded_token: &str) -> Vec<FilterOutput> {
-        self.inner
-            .write_decoded(decoded_token, TokenIDsWithLogProb::new())
+    fn write_decoded<'py>(
+        &mut self,
+        py: Python<'py>,
+        decoded_token: &str,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        self.run(py, decoded_token.len(), |inner| {
+            let out = inner.write_decoded(decoded_token, TokenIDsWithLogProb::new());
+            let events = out.len();
+            (coalesce_outputs(out), events)
+        })
+    }
+
+    /// Process a decoded token and return the outputs column by column.
+    ///
+    /// Equivalent to `write_decoded`, but instead of one object per output the
+    /// result holds one list per field, which avoids creating a Python object
+    /// for every output and every tool call delta.
+    ///
+    /// Args:
+    ///     `decoded_token`: The decoded text for this token
+    ///
+    /// Returns:
+    ///     A `PyFilterColumns` with one entry per output in each list
+    fn write_decoded_columns<'py>(
+        &mut self,
+        py: Python<'py>,
+        decoded_token: &str,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        self.run(py, decoded_token.len(), |inner| {
+            let out = inner.write_decoded(decoded_token, TokenIDsWithLogProb::new());
+            let events = out.len();
+            (FilterColumns::from(coalesce_outputs(out)), events)
+        })
+    }
+
+    /// Process a sequence of decoded tokens in a single call.
+    ///
+    /// Equivalent to calling `write_decoded` for each token in order, but
+    /// crosses the Python boundary only once.
+    ///
+    /// Args:
+    ///     `decoded_tokens`: The decoded text for each token
+    ///
+    /// Returns:
+    ///     Flat list of `FilterOutput` objects for all tokens, with adjacent
+    ///     text outputs of the same kind merged across tokens
+    fn write_decoded_many<'py>(
+        &mut self,
+        py: Python<'py>,
+        decoded_tokens: Vec<String>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let bytes_in = decoded_tokens.iter().map(String::len).sum();
+        self.run(py, bytes_in, |inner| {
+            let mut out = Vec::with_capacity(decoded_tokens.len());
+            for decoded_token in &decoded_tokens {
+                out.extend(inner.write_decoded(decoded_token, TokenIDsWithLogProb::new()));
+            }
+            let events = out.len();
+            (coalesce_outputs(out), events)
+        })
+    }
+
+    /// Process all decoded tokens of a complete generation.
+    ///
+    /// The outputs are aggregated on the Rust side, so only the final content,
+    /// reasoning and tool calls are converted to Python objects. The text does
+    /// not have to be split into tokens: a single string with the whole
+    /// generation gives the same result. Text before a trailing partial
+    /// special token is included, as it is when streaming token by token.
+    ///
+    /// Args:
+    ///     `decoded_tokens`: The decoded text for each token, or larger chunks of it
+    ///
+    /// Returns:
+    ///     A `FilterResult` with the aggregated outputs
+    fn extract_all<'py>(
+        &mut self,
+        py: Python<'py>,
+        decoded_tokens: Vec<String>,
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let bytes_in = decoded_tokens.iter().map(String::len).sum();
+        self.run(py, bytes_in, |inner| {
+            let mut result = FilterResult::default();
+            let mut events = 0;
+            for decoded_token in &decoded_tokens {
+                for output in inner.write_decoded(decoded_token, TokenIDsWithLogProb::new()) {
+                    result.push(output);
+                    events += 1;
+                }
+            }
+            // the generation is complete, so text before a trailing partial
+            // special token is not waiting for more tokens
+            for output in inner.write_pending_text() {
+                result.push(output);
+                events += 1;
+            }
+            (result, events)
+        })
     }
 
     /// Flush any buffered partial outputs.
@@ -56,8 +221,112 @@ impl PyFilter {
     ///
     /// Returns:
     ///     List of remaining `FilterOutput` objects
-    fn flush_partials(&mut self) -> Vec<FilterOutput> {
-        self.inner.flush_partials()
+    fn flush_partials<'py>(&mut self, py: Python<'py>) -> PyResult<Bound<'py, PyAny>> {
+        self.run(py, 0, |inner| {
+            let out = inner.flush_partials();
+            let events = out.len();
+            (out, events)
+        })
+    }
+
+    /// Return the counters recorded by a filter created with `with_stats()`.
+    ///
+    /// The counters are accumulated over every call since the filter was
+    /// created, including across `reset()`:
+    ///
+    /// - `bytes_in`: Bytes of decoded text written to the filter
+    /// - `filter_ns`: Time spent filtering with the GIL released
+    /// - `convert_ns`: Time spent converting the results to Python objects
+    /// - `events_emitted`: Number of outputs produced before coalescing
+    ///
+    /// Returns:
+    ///     A dict with the counters, or None if stats are not enabled
+    fn stats(&self) -> Option<HashMap<&'static str, u64>> {
+        self.stats.as_ref().map(|stats| {
+            HashMap::from([
+                ("bytes_in", stats.bytes_in),
+                ("filter_ns", stats.filter_ns),
+                ("convert_ns", stats.convert_ns),
+                ("events_emitted", stats.events_emitted),
+            ])
+        })
+    }
+}
+
+/// Filter outputs stored as parallel lists, one entry per output.
+///
+/// The tool call lists hold `None` for outputs without a tool call delta.
+/// The lists are created once, so reading an attribute returns the same list
+/// every time instead of a new copy.
+#[pyclass(frozen, get_all)]
+struct PyFilterColumns {
+    texts: Py<PyList>,
+    is_reasoning: Py<PyList>,
+    tool_call_ids: Py<PyList>,
+    tool_call_indices: Py<PyList>,
+    tool_call_names: Py<PyList>,
+    tool_call_raw_param_deltas: Py<PyList>,
+}
+
+/// Columns of filter outputs, collected with the GIL released and converted
+/// to a `PyFilterColumns` afterwards.
+struct FilterColumns {
+    texts: Vec<String>,
+    is_reasoning: Vec<bool>,
+    tool_call_ids: Vec<Option<String>>,
+    tool_call_indices: Vec<Option<usize>>,
+    tool_call_names: Vec<Option<String>>,
+    tool_call_raw_param_deltas: Vec<Option<String>>,
+}
+
+impl From<Vec<FilterOutput>> for FilterColumns {
+    fn from(outputs: Vec<FilterOutput>) -> Self {
+        let n = outputs.len();
+        let mut columns = FilterColumns {
+            texts: Vec::with_capacity(n),
+            is_reasoning: Vec::with_capacity(n),
+            tool_call_ids: Vec::with_capacity(n),
+            tool_call_indices: Vec::with_capacity(n),
+            tool_call_names: Vec::with_capacity(n),
+            tool_call_raw_param_deltas: Vec::with_capacity(n),
+        };
+        for output in outputs {
+            columns.texts.push(output.text);
+            columns.is_reasoning.push(output.is_reasoning);
+            let delta = output.tool_call_delta;
+            columns
+                .tool_call_indices
+                .push(delta.as_ref().map(|d| d.index));
+            let (id, name, raw_param_delta) = match delta {
+                Some(d) => (Some(d.id), Some(d.name), Some(d.raw_param_delta)),
+                None => (None, None, None),
+            };
+            columns.tool_call_ids.push(id);
+            columns.tool_call_names.push(name);
+            columns.tool_call_raw_param_deltas.push(raw_param_delta);
+        }
+        columns
+    }
+}
+
+impl<'py> IntoPyObject<'py> for FilterColumns {
+    type Target = PyFilterColumns;
+    type Output = Bound<'py, PyFilterColumns>;
+    type Error = PyErr;
+
+    fn into_pyobject(self, py: Python<'py>) -> PyResult<Self::Output> {
+        Bound::new(
+            py,
+            PyFilterColumns {
+                texts: PyList::new(py, self.texts)?.unbind(),
+                is_reasoning: PyList::new(py, self.is_reasoning)?.unbind(),
+                tool_call_ids: PyList::new(py, self.tool_call_ids)?.unbind(),
+                tool_call_indices: PyList::new(py, self.tool_call_indices)?.unbind(),
+                tool_call_names: PyList::new(py, self.tool_call_names)?.unbind(),
+                tool_call_raw_param_deltas: PyList::new(py, self.tool_call_raw_param_deltas)?
+                    .unbind(),
+            },
+        )
     }
 }
 
@@ -68,6 +337,7 @@ impl PyFilter {
 #[pyclass]
 struct PyFilterOptions {
     inner: FilterOptions,
+    stats: bool,
 }
 
 #[pymethods]
@@ -80,6 +350,7 @@ impl PyFilterOptions {
     fn new() -> Self {
         PyFilterOptions {
             inner: FilterOptions::default(),
+            stats: false,
         }
     }
 
@@ -105,6 +376,27 @@ impl PyFilterOptions {
         slf
     }
 
+    /// Set the number of bytes reserved up front for buffered content.
+    ///
+    /// Args:
+    ///     capacity: Number of bytes to reserve (defaults to 4096)
+    ///
+    /// Returns:
+    ///     Self (for method chaining)
+    fn with_initial_capacity(mut slf: PyRefMut<Self>, capacity: usize) -> PyRefMut<Self> {
+        slf.inner = std::mem::take(&mut slf.inner).with_initial_capacity(capacity);
+        slf
+    }
+
+    /// Record timing and volume counters, returned by `PyFilter.stats()`.
+    ///
+    /// Returns:
+    ///     Self (for method chaining)
+    fn with_stats(mut slf: PyRefMut<Self>) -> PyRefMut<Self> {
+        slf.stats = true;
+        slf
+    }
+
     /// Remove a special token from the configuration.
     ///
     /// Args:
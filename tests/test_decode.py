@@ -0,0 +1,72 @@
+import pytest
+
+from cohere_melody_vllm._decode import MAX_PENDING_TOKENS, _iter_decoded
+
+TEXTS = [
+    "hello world",
+    "naïve café, 10™ and 5€",
+    "rainbow 🌈 and 😀😀",
+    "a literal � in the text",
+    "<|START_RESPONSE|>hello 中文<|END_RESPONSE|>",
+]
+
+
+class BytesTokenizer:
+    """Tokenizer whose tokens are byte strings, split regardless of characters."""
+
+    def __init__(self):
+        self.vocab: list[bytes] = []
+
+    def encode(self, text, sizes=(1, 3)):
+        data = text.encode()
+        token_ids = []
+        i = 0
+        while i < len(data):
+            self.vocab.append(data[i : i + sizes[len(token_ids) % len(sizes)]])
+            token_ids.append(len(self.vocab) - 1)
+            i += len(self.vocab[-1])
+        return token_ids
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        data = b"".join(self.vocab[t] for t in token_ids)
+        return data.decode("utf-8", errors="replace")
+
+
+def decode_fragments(tokenizer, token_ids):
+    fragments = list(_iter_decoded(tokenizer, token_ids))
+    assert all(len(ids) > 0 for _, ids in fragments)
+    assert [t for _, ids in fragments for t in ids] == token_ids
+    return "".join(text for text, _ in fragments)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_iter_decoded(text):
+    tokenizer = BytesTokenizer()
+    token_ids = tokenizer.encode(text)
+    # prefixes end in the middle of multi byte characters
+    for i in range(1, len(token_ids) + 1):
+        decoded = tokenizer.decode(token_ids[:i])
+        assert decode_fragments(tokenizer, token_ids[:i]) == decoded
+
+
+def test_iter_decoded_fragments():
+    tokenizer = BytesTokenizer()
+    token_ids = tokenizer.encode("a€b", sizes=(1, 2, 1, 1))
+    assert list(_iter_decoded(tokenizer, token_ids)) == [
+        ("a", token_ids[:1]),
+        ("€", token_ids[1:3]),
+        ("b", token_ids[3:]),
+    ]
+
+
+def test_iter_decoded_bounded():
+    tokenizer = BytesTokenizer()
+    token_ids = tokenizer.encode("���", sizes=(3,))
+    fragments = list(_iter_decoded(tokenizer, token_ids))
+    assert fragments == [("���", token_ids)]
+
+    # a replacement character is buffered at most MAX_PENDING_TOKENS tokens
+    token_ids = tokenizer.encode("�" * 6, sizes=(3,))
+    fragments = list(_iter_decoded(tokenizer, token_ids))
+    assert [len(ids) for _, ids in fragments] == [MAX_PENDING_TOKENS, 2]
+    assert "".join(text for text, _ in fragments) == "�" * 6
@@ -1,4 +1,5 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from cohere_melody import PyFilter, PyFilterOptions
 
 
@@ -15,3 +16,124 @@ def test_simple_filter():
     fo = f.write_decoded("<|START_RESPONSE|>This is the final response.")
     assert fo[0].text == "This is the final response."
     assert fo[0].is_reasoning == False
+
+
+def test_reset():
+    f = PyFilter(PyFilterOptions().cmd3())
+    f.write_decoded("<|START_THINKING|>This is a")
+
+    f.reset()
+    fo = f.write_decoded("This is the final response.")
+    assert fo[0].text == "This is the final response."
+    assert fo[0].is_reasoning == False
+
+
+def test_write_decoded_many():
+    tokens = ["<|START_THINKING|>", "This is a", " plan.", "<|END_THINKING|>"]
+    tokens += ["<|START_RESPONSE|>", "This is the final response."]
+
+    f = PyFilter(PyFilterOptions().cmd3())
+    fo = f.write_decoded_many(tokens)
+    assert [(o.text, o.is_reasoning) for o in fo] == [
+        ("This is a plan.", True),
+        ("This is the final response.", False),
+    ]
+
+
+def test_extract_all():
+    f = PyFilter(PyFilterOptions().cmd3())
+    result = f.extract_all(
+        [
+            "<|START_THINKING|>",
+            "I will",
+            " search.",
+            "<|END_THINKING|>",
+            "<|START_ACTION|>",
+            '[\n    {"tool_call_id": "0", "tool_name": "sea',
+            'rch", "parameters": {"query": "melo',
+            'dy"}}\n]',
+            "<|END_ACTION|>",
+        ]
+    )
+    assert result.reasoning == "I will search."
+    assert len(result.tool_calls) == 1
+    assert result.tool_calls[0].id == "0"
+    assert result.tool_calls[0].name == "search"
+    assert result.tool_calls[0].arguments == '{"query": "melody"}'
+
+
+def test_extract_all_whole_text():
+    tokens = [
+        "<|START_THINKING|>",
+        "I will",
+        " search.",
+        "<|END_THINKING|>",
+        "<|START_ACTION|>",
+        '[\n    {"tool_call_id": "0", "tool_name": "sea',
+        'rch", "parameters": {"query": "melo',
+        'dy"}}\n]',
+        "<|END_ACTION|>",
+    ]
+    per_token = PyFilter(PyFilterOptions().cmd3()).extract_all(tokens)
+    whole = PyFilter(PyFilterOptions().cmd3()).extract_all(["".join(tokens)])
+    assert whole.reasoning == per_token.reasoning
+    assert whole.content == per_token.content
+    assert [(c.id, c.name, c.arguments) for c in whole.tool_calls] == [
+        (c.id, c.name, c.arguments) for c in per_token.tool_calls
+    ]
+
+
+@pytest.mark.parametrize("trailing", [" <", " <|", " <|END"])
+def test_extract_all_trailing_partial_token(trailing):
+    tokens = ["Use", " the", trailing]
+    f = PyFilter(PyFilterOptions().cmd3())
+    per_token = "".join(o.text for t in tokens for o in f.write_decoded(t))
+    assert per_token == "Use the"
+
+    whole = PyFilter(PyFilterOptions().cmd3()).extract_all(["".join(tokens)])
+    assert whole.content == per_token
+    assert PyFilter(PyFilterOptions().cmd3()).extract_all(tokens).content == per_token
+
+
+def test_filters_in_threads():
+    def run(i):
+        f = PyFilter(PyFilterOptions().cmd3())
+        fo = f.write_decoded_many([f"Response {i}"] * 100)
+        return "".join(o.text for o in fo)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(run, range(8)))
+    assert results == ["".join([f"Response {i}"] * 100) for i in range(8)]
+
+
+def test_write_decoded_columns():
+    f = PyFilter(PyFilterOptions().cmd3())
+    fo = f.write_decoded_columns("<|START_THINKING|>This is a")
+    assert fo.texts == ["This is a"]
+    assert fo.is_reasoning == [True]
+    assert fo.tool_call_indices == [None]
+    # the lists are built once, not on every attribute access
+    assert fo.texts is fo.texts
+
+    f.write_decoded_columns("<|END_THINKING|>")
+    f.write_decoded_columns("<|START_ACTION|>")
+    fo = f.write_decoded_columns('[\n    {"tool_call_id": "0", "tool_name": "search"')
+    assert fo.tool_call_ids == ["0", ""]
+    assert fo.tool_call_indices == [0, 0]
+    assert fo.tool_call_names == ["", "search"]
+
+
+def test_stats():
+    assert PyFilter(PyFilterOptions().cmd3()).stats() is None
+
+    f = PyFilter(PyFilterOptions().cmd3().with_stats())
+    f.write_decoded("<|START_RESPONSE|>")
+    chunk = "0123456789abcdef"
+    for _ in range((1 << 20) // len(chunk)):
+        f.write_decoded(chunk)
+
+    stats = f.stats()
+    assert stats["bytes_in"] == len("<|START_RESPONSE|>") + (1 << 20)
+    assert stats["events_emitted"] >= (1 << 20) // len(chunk)
+    assert stats["filter_ns"] > 0
+    assert stats["convert_ns"] > 0
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("vllm")
+
+from vllm.entrypoints.openai.protocol import DeltaMessage
+
+from cohere_melody import PyFilter, PyFilterOptions
+from cohere_melody_vllm.parser import _text_fields
+
+
+def test_text_fields_delta_message():
+    f = PyFilter(PyFilterOptions().cmd3())
+    out = f.write_decoded_columns("<|START_THINKING|>This is a")
+    msg = DeltaMessage(**_text_fields(out))
+    assert msg.reasoning == "This is a"
+    assert msg.reasoning_content == "This is a"
+    assert msg.content is None
+
+    f.write_decoded_columns("<|END_THINKING|>")
+    out = f.write_decoded_columns("<|START_RESPONSE|>Done.")
+    msg = DeltaMessage(**_text_fields(out))
+    assert msg.content == "Done."
+    assert msg.reasoning is None